@@ -379,6 +379,11 @@ class Analysis(object):
         object equality.
         """
 
+        # Fast path: most keyword and positional expressions in screen
+        # language are literals, which never need the full walk below.
+        if isinstance(node, (ast.Num, ast.Str)):
+            return GLOBAL_CONST
+
         def check_slice(slice): # @ReservedAssignment
 
             if isinstance(slice, ast.Index):
@@ -371,6 +371,11 @@ class Analysis(object):
         object equality.
         """
 
+        # Fast path: most keyword and positional expressions in screen
+        # language are literals, which never need the full walk below.
+        if isinstance(node, ast.Constant):
+            return GLOBAL_CONST
+
         def check_name(node):
             """
             Check nodes that make up a name. This returns a pair:
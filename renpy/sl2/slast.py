@@ -45,7 +45,6 @@ from renpy.display.transform import Transform, ATLTransform
 from renpy.display.layout import Fixed
 from renpy.display.predict import displayable as predict_displayable
 
-from renpy.python import py_eval_bytecode
 from renpy.pyanalysis import Analysis, NOT_CONST, LOCAL_CONST, GLOBAL_CONST, ccache
 
 import hashlib
@@ -68,12 +67,23 @@ filename = '<screen language>'
 profile_log = renpy.log.open("profile_screen", developer=True, append=False, flush=False)
 
 
-def compile_expr(loc, node):
+# A cache of the results of compile_expr, keyed on (filename, node). The
+# same node is compiled repeatedly - ccache.ast_eval returns a shared node
+# per expression, the const and not-const copies of a screen share their
+# keyword lists, and screens are re-prepared after init code runs.
+compile_expr_cache = { }
+
+
+def compile_expr_node(loc, node):
     """
-    Wraps the node in a python AST, and compiles it.
+    Wraps the node in a python AST, and compiles it, without consulting the
+    cache. This is used for nodes that are built fresh at each prepare, which
+    would otherwise add an entry to the cache every time a screen is
+    re-prepared.
     """
 
     filename = loc[0]
+
     if filename in renpy.python.py3_files:
         flags = renpy.python.py3_compile_flags
     else:
@@ -81,9 +91,82 @@ def compile_expr(loc, node):
 
     expr = ast.Expression(body=node)
     ast.fix_missing_locations(expr)
+
     return compile(expr, filename, "eval", flags, 1)
 
 
+def compile_expr(loc, node):
+    """
+    Wraps the node in a python AST, and compiles it.
+    """
+
+    key = (loc[0], node)
+
+    rv = compile_expr_cache.get(key, None)
+
+    if rv is None:
+        rv = compile_expr_cache[key] = compile_expr_node(loc, node)
+
+    return rv
+
+
+def eval_const_expr(loc, node):
+    """
+    Compiles `node` and evaluates it in the store. This is used at prepare
+    time to evaluate expressions the analysis has proven constant, and calls
+    eval directly rather than going through py_eval_bytecode.
+    """
+
+    store = renpy.python.store_dicts["store"]
+    return eval(compile_expr(loc, node), store)
+
+
+def is_immutable(value):
+    """
+    Returns True if `value` is known to be immutable, and so a single
+    instance of it can be safely shared.
+    """
+
+    if (value is None) or isinstance(value, (bool, int, float, basestring, bytes)):
+        return True
+
+    if isinstance(value, tuple):
+        return all(is_immutable(i) for i in value)
+
+    return False
+
+
+def literal_node(value):
+    """
+    If `value` can be spliced into an AST as a literal constant node, returns
+    that node. Otherwise, returns None. These are exact type checks, as
+    compile rejects a Constant holding a subclass instance.
+    """
+
+    t = type(value)
+
+    if PY2:
+
+        if (t is int) or (t is float):
+            return ast.Num(n=value)
+
+        if t is unicode:
+            return ast.Str(s=value)
+
+        return None
+
+    if (value is None) or (value is True) or (value is False):
+        return ast.Constant(value=value)
+
+    if (t is int) or (t is float) or (t is str) or (t is bytes):
+        return ast.Constant(value=value)
+
+    if (t is tuple) and all(literal_node(i) is not None for i in value):
+        return ast.Constant(value=value)
+
+    return None
+
+
 class SLContext(renpy.ui.Addable):
     """
     A context object that can be passed to the execute methods, and can also
@@ -356,6 +439,10 @@ class SLBlock(SLNode):
     # RawBlock from parse or None if not present.
     atl_transform = None
 
+    # True if this block's keywords may set the style prefix. Recomputed in
+    # prepare.
+    style_prefix_keyword = True
+
     def __init__(self, loc):
         SLNode.__init__(self, loc)
 
@@ -389,9 +476,8 @@ class SLBlock(SLNode):
 
         # Compile the keywords.
 
-        keyword_values = { }
-        keyword_keys = [ ]
-        keyword_exprs = [ ]
+        keyword_nodes = [ ]
+        has_dynamic = False
 
         for k, expr in self.keyword:
 
@@ -399,14 +485,49 @@ class SLBlock(SLNode):
 
             const = analysis.is_constant(node)
 
+            if const != GLOBAL_CONST:
+                has_dynamic = True
+
+            keyword_nodes.append((k, expr, node, const))
+
+            self.constant = min(self.constant, const)
+
+        # The names of keywords with constant values, used when reporting
+        # debug information.
+        self.constant_keywords = { k for k, _expr, _node, const in keyword_nodes if const == GLOBAL_CONST }
+
+        # Only this block's own keywords can place a style prefix in
+        # context.keywords - keyword children pop theirs themselves - so the
+        # pops in keywords() can be skipped when neither name appears.
+        self.style_prefix_keyword = any((k == "style_prefix") or (k == "style_group") for k, _expr in self.keyword)
+
+        keyword_values = { }
+        keyword_keys = [ ]
+        keyword_exprs = [ ]
+
+        for k, _expr, node, const in keyword_nodes:
+
             if const == GLOBAL_CONST:
-                keyword_values[k] = py_eval_bytecode(compile_expr(self.location, node))
+                value = eval_const_expr(self.location, node)
+
+                # If dynamic keywords force a dict to be evaluated each time
+                # this executes anyway, bake constant values into that dict
+                # as literal nodes, so a single update applies both.
+                if has_dynamic:
+                    literal = literal_node(value)
+
+                    if literal is not None:
+                        ast.copy_location(literal, node)
+                        keyword_keys.append(ast.Str(s=k))
+                        keyword_exprs.append(literal)
+                        continue
+
+                keyword_values[k] = value
+
             else:
                 keyword_keys.append(ast.Str(s=k))
                 keyword_exprs.append(node) # Will be compiled as part of ast.Dict below.
 
-            self.constant = min(self.constant, const)
-
         if keyword_values:
             self.keyword_values = keyword_values
         else:
@@ -415,7 +536,7 @@ class SLBlock(SLNode):
         if keyword_keys:
             node = ast.Dict(keys=keyword_keys, values=keyword_exprs)
             ast.copy_location(node, keyword_exprs[0])
-            self.keyword_exprs = compile_expr(self.location, node)
+            self.keyword_exprs = compile_expr_node(self.location, node)
         else:
             self.keyword_exprs = None
 
@@ -456,17 +577,37 @@ class SLBlock(SLNode):
                 if not renpy.config.developer:
                     break
 
+        # The children this node executes, with the children of plain nested
+        # blocks flattened in, so execute doesn't have to recurse through
+        # blocks that do nothing of their own. (Keyword handling still goes
+        # through self.children.)
+        flat_children = [ ]
+
+        for i in self.children:
+            if type(i) is SLBlock:
+                flat_children.extend(i.flat_children)
+            else:
+                flat_children.append(i)
+
+        self.flat_children = flat_children
+
+        # The bound execute methods of flat_children, so executing a child
+        # doesn't need to look the method up each frame.
+        self.child_executes = [ i.execute for i in flat_children ]
+
     def execute(self, context):
 
         # Note: SLBlock.execute() is inlined in various locations for performance
         # reasons.
 
-        for i in self.children:
+        predicting = context.predicting
+
+        for f in self.child_executes:
 
             try:
-                i.execute(context)
+                f(context)
             except Exception:
-                if not context.predicting:
+                if not predicting:
                     raise
 
     def keywords(self, context):
@@ -488,13 +629,15 @@ class SLBlock(SLNode):
             transform = ATLTransform(self.atl_transform, context=context.scope)
             context.keywords["at"] = transform
 
-        style_prefix = context.keywords.pop("style_prefix", NotGiven)
+        if self.style_prefix_keyword:
+
+            style_prefix = context.keywords.pop("style_prefix", NotGiven)
 
-        if style_prefix is NotGiven:
-            style_prefix = context.keywords.pop("style_group", NotGiven)
+            if style_prefix is NotGiven:
+                style_prefix = context.keywords.pop("style_group", NotGiven)
 
-        if style_prefix is not NotGiven:
-            context.style_prefix = style_prefix
+            if style_prefix is not NotGiven:
+                context.style_prefix = style_prefix
 
     def copy_on_change(self, cache):
         for i in self.children:
@@ -562,6 +705,15 @@ class SLBlock(SLNode):
 
 list_or_tuple = (list, tuple)
 
+# A pool of children lists that are no longer referenced, and can be reused
+# by SLDisplayable.execute.
+child_pool = [ ]
+
+# A cache of computed style names, keyed by (style_prefix, style_suffix).
+# Sharing the name avoids a string concatenation per displayable per frame,
+# and lets keyword comparisons take the identity fast path.
+style_name_cache = { }
+
 
 class SLCache(object):
     """
@@ -576,6 +728,10 @@ class SLCache(object):
         # The positional arguments that were used to create the displayable.
         self.positional = None # type: Any
 
+        # The tuple the positional argument expressions evaluated to on the
+        # last execute, used to avoid re-merging when it hasn't changed.
+        self.raw_positional = None # type: Any
+
         # The keyword arguments that were used to created the displayable.
         self.keywords = None # type: Optional[dict[str, Any]]
 
@@ -765,6 +921,11 @@ class SLDisplayable(SLBlock):
 
         SLBlock.prepare(self, analysis)
 
+        # A custom statement can supply a style prefix through its default
+        # keywords.
+        if not self.style_prefix_keyword:
+            self.style_prefix_keyword = ("style_prefix" in self.default_keywords) or ("style_group" in self.default_keywords)
+
         # Prepare the positional arguments.
 
         exprs = [ ]
@@ -778,7 +939,7 @@ class SLDisplayable(SLBlock):
             const = analysis.is_constant(node)
 
             if const == GLOBAL_CONST:
-                values.append(py_eval_bytecode(compile_expr(self.location, node)))
+                values.append(eval_const_expr(self.location, node))
                 exprs.append(ast.Num(n=0))
                 has_values = True
             else:
@@ -796,10 +957,22 @@ class SLDisplayable(SLBlock):
         if has_exprs:
             t = ast.Tuple(elts=exprs, ctx=ast.Load())
             ast.copy_location(t, exprs[0])
-            self.positional_exprs = compile_expr(self.location, t)
+            self.positional_exprs = compile_expr_node(self.location, t)
         else:
             self.positional_exprs = None
 
+        if has_values and has_exprs:
+
+            # A function that merges the evaluated expression tuple with the
+            # constant values. This is specialized at prepare time, so the
+            # per-argument choice between constant and expression is not
+            # remade on every execute.
+            parts = [ "v[%d]" % i if v is use_expression else "c[%d]" % i for i, v in enumerate(values) ]
+            self.positional_merge = eval("lambda v, c=c: [ %s ]" % ", ".join(parts), { "c" : values })
+
+        else:
+            self.positional_merge = None
+
         # We do not pass keywords to our parents.
         self.has_keyword = False
 
@@ -815,6 +988,39 @@ class SLDisplayable(SLBlock):
         if self.variable is not None:
             self.constant = NOT_CONST
 
+        # If every keyword is constant and none require processing at
+        # execute time, a prebuilt keywords dict with the default keywords
+        # merged in. Otherwise, None.
+        self.frozen_keywords = None
+
+        if (self.keyword_exprs is None) and (not self.keyword_children) and (self.atl_transform is None):
+
+            keys = set(self.keyword_values or ()) | set(self.default_keywords)
+
+            if not (keys & { "id", "at", "style_suffix", "style_prefix", "style_group", "arguments", "properties" }):
+
+                frozen = dict(self.default_keywords)
+
+                if self.keyword_values:
+                    frozen.update(self.keyword_values)
+
+                self.frozen_keywords = frozen
+
+                # A map from the style prefix to frozen_keywords with the
+                # computed style name added.
+                self.frozen_style_keywords = { }
+
+        # For a leaf - a displayable with no children that isn't passed its
+        # context - the context used by the last execute, which can be
+        # reused, as nothing that runs inside it can retain or re-enter it.
+        self.leaf_context = None
+
+        # A map from the style prefix to the constant displayable this node
+        # created with that prefix, used to share constant displayables
+        # between instances of a screen. Re-preparing the screen invalidates
+        # this cache.
+        self.constant_cache = { }
+
     def keywords(self, context):
         # We do not want to pass keywords to our parents, so just return.
         return
@@ -822,6 +1028,7 @@ class SLDisplayable(SLBlock):
     def execute(self, context):
 
         debug = context.debug
+        predicting = context.predicting
 
         screen = renpy.ui.screen
 
@@ -875,355 +1082,501 @@ class SLDisplayable(SLBlock):
 
                 return
 
-        # Create the context.
-        ctx = SLContext(context)
+        if (cache.constant is None) and (self.constant == GLOBAL_CONST):
+
+            d = self.constant_cache.get(context.style_prefix, None)
 
-        # True if we encountered an exception that we're recovering from
-        # due to being in prediction mode.
-        fail = False
+            if d is not None:
 
-        # The main displayable we're predicting.
-        main = None
+                # Seed this instance's cache with the displayable another
+                # instance of this screen created, so it's handled by the
+                # constant path from here on out.
+                cache.constant = d
+                cache.constant_uses_scope = [ ]
+                cache.style_prefix = context.style_prefix
 
-        # True if we've pushed something onto the imagemap stack.
-        imagemap = False
+                if context.showif is not None:
+                    d = self.wrap_in_showif(d, context, cache)
 
-        # True if we're reusing a displayable.
-        reused = False
+                context.children.append(d)
 
-        try:
-            # Evaluate the positional arguments.
-            positional_values = self.positional_values
-            positional_exprs = self.positional_exprs
-
-            if positional_values and positional_exprs:
-                values = eval(positional_exprs, context.globals, context.scope)
-                positional = [ b if (a is use_expression) else a for a, b in zip(positional_values, values) ]
-            elif positional_values:
-                positional = positional_values
-            elif positional_exprs:
-                positional = eval(positional_exprs, context.globals, context.scope)
+                if debug:
+                    profile_log.write("    reused shared constant displayable")
+
+                return
+
+        # Create the context, reusing the per-node one for leaves.
+        if self.children or self.pass_context:
+            ctx = SLContext(context)
+        else:
+            ctx = self.leaf_context
+
+            if ctx is None:
+                ctx = self.leaf_context = SLContext(context)
             else:
-                positional = [ ]
+                ctx.__dict__.update(context.__dict__)
 
-            keywords = ctx.keywords = self.default_keywords.copy()
+        try:
 
-            if self.constant:
-                ctx.uses_scope = [ ] # type: ignore
+            # True if we encountered an exception that we're recovering from
+            # due to being in prediction mode.
+            fail = False
 
-            SLBlock.keywords(self, ctx)
+            # The main displayable we're predicting.
+            main = None
 
-            arguments = keywords.pop("arguments", None)
-            if arguments:
-                positional += arguments
+            # True if we've pushed something onto the imagemap stack.
+            imagemap = False
 
-            properties = keywords.pop("properties", None)
-            if properties:
-                keywords.update(properties)
+            # True if we're reusing a displayable.
+            reused = False
 
-            # Get the widget id and transform, if any.
-            widget_id = keywords.pop("id", None)
-            transform = keywords.pop("at", None)
+            try:
+                # Evaluate the positional arguments.
+                positional_values = self.positional_values
+                positional_exprs = self.positional_exprs
 
-            # If we don't know the style, figure it out.
-            style_suffix = keywords.pop("style_suffix", None) or self.style
-            if ("style" not in keywords) and style_suffix:
-                if ctx.style_prefix is None:
-                    keywords["style"] = style_suffix
+                if positional_values and positional_exprs:
+                    values = eval(positional_exprs, context.globals, context.scope)
+
+                    # If the expressions evaluated to the same values as last
+                    # time, the merged list from last time can be shared.
+                    if (cache.positional is not None) and (values == cache.raw_positional):
+                        positional = cache.positional
+                    else:
+                        positional = self.positional_merge(values)
+
+                    cache.raw_positional = values
+                elif positional_values:
+                    positional = positional_values
+                elif positional_exprs:
+                    positional = eval(positional_exprs, context.globals, context.scope)
                 else:
-                    keywords["style"] = ctx.style_prefix + "_" + style_suffix
+                    positional = [ ]
 
-            if widget_id and (widget_id in screen.widget_properties):
-                keywords.update(screen.widget_properties[widget_id])
+                if self.constant:
+                    ctx.uses_scope = [ ] # type: ignore
 
-            old_d = cache.displayable
-            if old_d:
-                old_main = old_d._main or old_d
-            else:
-                old_main = None
+                keywords = self.frozen_keywords
 
-            if debug:
-                self.report_arguments(cache, positional, keywords, transform)
+                if keywords is not None:
 
-            can_reuse = (old_d is not None) and (positional == cache.positional) and (keywords == cache.keywords) and (context.style_prefix == cache.style_prefix)
-            if (self.variable is not None) and copy_on_change:
-                can_reuse = False
+                    # All keywords are constant, and none require execute-time
+                    # processing, so the prebuilt dict can be used directly.
 
-            # A hotspot can only be reused if the imagemap it belongs to has
-            # not changed.
-            if self.hotspot:
+                    widget_id = None
+                    transform = None
 
-                imc = renpy.ui.imagemap_stack[-1]
-                if cache.imagemap is not imc:
-                    can_reuse = False
+                    if self.style and ("style" not in keywords):
 
-                cache.imagemap = imc
+                        style_keywords = self.frozen_style_keywords.get(ctx.style_prefix, None)
 
-            if can_reuse:
-                reused = True
-                d = old_d
+                        if style_keywords is None:
+                            style_keywords = dict(keywords)
 
-                # The main displayable, if d is a composite displayable. (This is
-                # the one that gets the scope, and gets children added to it.)
-                main = old_main
+                            if ctx.style_prefix is None:
+                                style_keywords["style"] = self.style
+                            else:
+                                style_keywords["style"] = ctx.style_prefix + "_" + self.style
 
-                if widget_id and not ctx.unlikely:
-                    screen.widgets[widget_id] = main
-                    screen.base_widgets[widget_id] = d
+                            self.frozen_style_keywords[ctx.style_prefix] = style_keywords
 
-                if self.scope and main._uses_scope: # type: ignore
-                    if copy_on_change:
-                        if main._scope(ctx.scope, False): # type: ignore
-                            reused = False
-                    else:
-                        main._scope(ctx.scope, True) # type: ignore
+                        keywords = style_keywords
 
-            if reused and self.imagemap:
-                imagemap = True
-                cache.imagemap.reuse()
-                renpy.ui.imagemap_stack.append(cache.imagemap)
+                    # The child creation code below adds entries to keywords, so
+                    # give it a copy it can write to.
+                    if self.scope or self.replaces or self.pass_context:
+                        keywords = dict(keywords)
 
-            if not reused:
-                cache.positional = positional
-                cache.keywords = keywords.copy()
+                    ctx.keywords = keywords
 
-                # This child creation code is copied below, for the copy_on_change
-                # case.
-                if self.scope:
-                    keywords["scope"] = ctx.scope
+                else:
 
-                if self.replaces and ctx.updating:
-                    keywords['replaces'] = old_main
+                    keywords = ctx.keywords = self.default_keywords.copy()
 
-                # Pass the context
-                if self.pass_context:
-                    keywords['context'] = ctx
+                    SLBlock.keywords(self, ctx)
 
-                d = self.displayable(*positional, **keywords)
-                d._unique()
-                main = d._main or d
+                    arguments = keywords.pop("arguments", None)
+                    if arguments:
+                        # Not +=, as positional may be a list shared with the
+                        # cache or the node. The cached list now includes the
+                        # arguments, so it can't be shared next frame.
+                        positional = positional + arguments
+                        cache.raw_positional = None
 
-                main._location = self.location
+                    properties = keywords.pop("properties", None)
+                    if properties:
+                        keywords.update(properties)
 
-                if widget_id and not ctx.unlikely:
-                    screen.widgets[widget_id] = main
-                    screen.base_widgets[widget_id] = d
-                # End child creation code.
+                    # Get the widget id and transform, if any.
+                    widget_id = keywords.pop("id", None)
+                    transform = keywords.pop("at", None)
 
-                imagemap = self.imagemap
+                    # If we don't know the style, figure it out.
+                    style_suffix = keywords.pop("style_suffix", None) or self.style
+                    if ("style" not in keywords) and style_suffix:
+                        if ctx.style_prefix is None:
+                            keywords["style"] = style_suffix
+                        else:
+                            key = (ctx.style_prefix, style_suffix)
 
-                cache.copy_on_change = False # We no longer need to copy on change.
-                cache.children = None # Re-add the children.
+                            style = style_name_cache.get(key, None)
 
-            if debug:
-                if reused:
-                    profile_log.write("    reused displayable")
-                elif self.constant:
-                    profile_log.write("    created constant displayable")
+                            if style is None:
+                                style = style_name_cache[key] = ctx.style_prefix + "_" + style_suffix
+
+                            keywords["style"] = style
+
+                    if widget_id and (widget_id in screen.widget_properties):
+                        keywords.update(screen.widget_properties[widget_id])
+
+                old_d = cache.displayable
+                if old_d:
+                    old_main = old_d._main or old_d
                 else:
-                    profile_log.write("    created displayable")
+                    old_main = None
 
-        except Exception:
-            if not context.predicting:
-                raise
-            fail = True
+                if debug:
+                    self.report_arguments(cache, positional, keywords, transform)
 
-        if self.variable is not None:
-            context.scope[self.variable] = main
+                can_reuse = (old_d is not None) and (positional == cache.positional) and (keywords == cache.keywords) and (context.style_prefix == cache.style_prefix)
+                if (self.variable is not None) and copy_on_change:
+                    can_reuse = False
 
-        ctx.children = [ ]
-        ctx.showif = None
+                # A hotspot can only be reused if the imagemap it belongs to has
+                # not changed.
+                if self.hotspot:
 
-        stack = renpy.ui.stack
-        stack.append(ctx) # type: ignore
+                    imc = renpy.ui.imagemap_stack[-1]
+                    if cache.imagemap is not imc:
+                        can_reuse = False
 
-        try:
+                    cache.imagemap = imc
 
-            # Evaluate children. (Inlined SLBlock.execute)
-            for i in self.children:
-                try:
-                    i.execute(ctx)
-                except Exception:
-                    if not context.predicting:
-                        raise
-                    fail = True
+                if can_reuse:
+                    reused = True
+                    d = old_d
 
-        finally:
+                    # The main displayable, if d is a composite displayable. (This is
+                    # the one that gets the scope, and gets children added to it.)
+                    main = old_main
 
-            ctx.keywords = None
+                    if widget_id and not ctx.unlikely:
+                        screen.widgets[widget_id] = main
+                        screen.base_widgets[widget_id] = d
 
-            stack.pop()
+                    if self.scope and main._uses_scope: # type: ignore
+                        if copy_on_change:
+                            if main._scope(ctx.scope, False): # type: ignore
+                                reused = False
+                        else:
+                            main._scope(ctx.scope, True) # type: ignore
 
-            if imagemap:
-                cache.imagemap = renpy.ui.imagemap_stack.pop()
-                cache.imagemap.cache.finish()
+                if reused and self.imagemap:
+                    imagemap = True
+                    cache.imagemap.reuse()
+                    renpy.ui.imagemap_stack.append(cache.imagemap)
 
-        # If a failure occurred during prediction, predict main (if known),
-        # and ctx.children, and return.
-        if fail:
-            predict_displayable(main)
+                if not reused:
+                    cache.positional = positional
+                    cache.keywords = keywords.copy()
 
-            for i in ctx.children:
-                predict_displayable(i)
+                    # This child creation code is copied below, for the copy_on_change
+                    # case.
+                    if self.scope:
+                        keywords["scope"] = ctx.scope
 
-            context.fail = True
+                    if self.replaces and ctx.updating:
+                        keywords['replaces'] = old_main
 
-            return
+                    # Pass the context
+                    if self.pass_context:
+                        keywords['context'] = ctx
+
+                    d = self.displayable(*positional, **keywords)
+                    d._unique()
+                    main = d._main or d
 
+                    main._location = self.location
 
-        if ctx.children != cache.children:
+                    if widget_id and not ctx.unlikely:
+                        screen.widgets[widget_id] = main
+                        screen.base_widgets[widget_id] = d
+                    # End child creation code.
 
-            if reused and copy_on_change:
+                    imagemap = self.imagemap
+
+                    cache.copy_on_change = False # We no longer need to copy on change.
+                    cache.children = None # Re-add the children.
+
+                if debug:
+                    if reused:
+                        profile_log.write("    reused displayable")
+                    elif self.constant:
+                        profile_log.write("    created constant displayable")
+                    else:
+                        profile_log.write("    created displayable")
 
-                keywords = keywords # type: ignore
+            except Exception:
+                if not predicting:
+                    raise
+                fail = True
 
-                # This is a copy of the child creation code from above.
-                if self.scope:
-                    keywords["scope"] = ctx.scope
+            if self.variable is not None:
+                context.scope[self.variable] = main
 
-                if self.replaces and context.updating:
-                    keywords['replaces'] = old_main # type: ignore
+            if child_pool:
+                ctx.children = child_pool.pop()
+            else:
+                ctx.children = [ ]
 
-                if self.pass_context:
-                    keywords['context'] = ctx
+            ctx.showif = None
 
-                d = self.displayable(*positional, **keywords) # type: ignore
-                main = d._main or d
+            stack = renpy.ui.stack
+            stack.append(ctx) # type: ignore
 
-                main._location = self.location
+            try:
 
-                if widget_id: # type: ignore
-                    screen.widgets[widget_id] = main
-                    screen.base_widgets[widget_id] = d
-                # End child creation code.
+                # Evaluate children. (Inlined SLBlock.execute)
+                for f in self.child_executes:
+                    try:
+                        f(ctx)
+                    except Exception:
+                        if not predicting:
+                            raise
+                        fail = True
 
-                cache.copy_on_change = False
-                reused = False
+            finally:
 
-            if reused:
-                main._clear()
+                ctx.keywords = None
 
-            if self.child_or_fixed and len(ctx.children) != 1:
-                f = Fixed()
+                stack.pop()
 
-                for i in ctx.children:
-                    f.add(i)
+                if imagemap:
+                    cache.imagemap = renpy.ui.imagemap_stack.pop()
+                    cache.imagemap.cache.finish()
 
-                main.add(f) # type: ignore
+            # If a failure occurred during prediction, predict main (if known),
+            # and ctx.children, and return.
+            if fail:
+                predict_displayable(main)
 
-            else:
                 for i in ctx.children:
-                    main.add(i) # type: ignore
+                    predict_displayable(i)
 
-        d = d # type: ignore
-        old_d = old_d # type: ignore
+                context.fail = True
 
-        # Inform the focus system about replacement displayables.
-        if (not context.predicting) and (old_d is not None):
-            replaced_by = renpy.display.focus.replaced_by
-            replaced_by[id(old_d)] = d
+                return
 
-            if d is not main:
-                for old_part, new_part in zip(old_d._composite_parts, d._composite_parts):
-                    replaced_by[id(old_part)] = new_part
 
-        cache.displayable = d
-        cache.children = ctx.children
-        cache.style_prefix = context.style_prefix
+            if ctx.children != cache.children:
 
-        transform = transform # type: ignore
+                if reused and copy_on_change:
 
-        if (transform is not None) and (d is not NO_DISPLAYABLE):
-            if reused and (transform == cache.raw_transform):
+                    keywords = keywords # type: ignore
 
-                if isinstance(cache.inner_transform, renpy.display.transform.Transform):
-                    if cache.inner_transform.child is not d:
-                        cache.inner_transform.set_child(d, duplicate=False)
+                    # This is a copy of the child creation code from above.
+                    if self.scope:
+                        keywords["scope"] = ctx.scope
 
-                d = cache.outer_transform
+                    if self.replaces and context.updating:
+                        keywords['replaces'] = old_main # type: ignore
 
-            else:
-                old_outer_transform = cache.outer_transform
+                    if self.pass_context:
+                        keywords['context'] = ctx
 
-                cache.raw_transform = transform
-                cache.inner_transform = None
-                cache.outer_transform = None
+                    d = self.displayable(*positional, **keywords) # type: ignore
+                    main = d._main or d
 
-                if isinstance(transform, Transform):
-                    d = transform(child=d)
-                    d._unique()
+                    main._location = self.location
 
-                    cache.inner_transform = d
-                    cache.outer_transform = d
+                    if widget_id: # type: ignore
+                        screen.widgets[widget_id] = main
+                        screen.base_widgets[widget_id] = d
+                    # End child creation code.
 
-                elif isinstance(transform, list_or_tuple):
-                    for t in transform:
-                        if isinstance(t, Transform):
-                            d = t(child=d)
+                    cache.copy_on_change = False
+                    reused = False
 
-                            cache.outer_transform = d
-                            if cache.inner_transform is None:
-                                cache.inner_transform = d
+                if reused:
+                    main._clear()
 
-                        else:
-                            d = t(d)
-                            cache.raw_transform = None
-                            cache.outer_transform = None
-                            cache.inner_transform = None
+                if self.child_or_fixed and len(ctx.children) != 1:
+                    f = Fixed()
 
-                        d._unique()
+                    add = f.add
+
+                    for i in ctx.children:
+                        add(i)
+
+                    main.add(f) # type: ignore
 
                 else:
-                    d = transform(d)
-                    d._unique()
-                    cache.raw_transform = None
-                    cache.outer_transform = None
-                    cache.inner_transform = None
+                    add = main.add # type: ignore
 
-                if isinstance(d, Transform):
+                    for i in ctx.children:
+                        add(i)
 
-                    if not context.updating:
-                        old_outer_transform = None
+            d = d # type: ignore
+            old_d = old_d # type: ignore
 
-                    d.take_state(old_outer_transform)
-                    d.take_execution_state(old_outer_transform)
+            # Inform the focus system about replacement displayables.
+            if (not predicting) and (old_d is not None):
+                replaced_by = renpy.display.focus.replaced_by
+                replaced_by[id(old_d)] = d
 
-        else:
-            cache.inner_transform = None
-            cache.outer_transform = None
-            cache.raw_transform = None
+                if d is not main:
+                    for old_part, new_part in zip(old_d._composite_parts, d._composite_parts):
+                        replaced_by[id(old_part)] = new_part
 
-        if ctx.fail:
-            context.fail = True
+            cache.displayable = d
 
-        else:
-            if self.constant:
-                cache.constant = d
+            old_children = cache.children
+            cache.children = ctx.children
+            cache.style_prefix = context.style_prefix
+
+            # The cache was the only thing referencing the old children list, so
+            # it can be recycled.
+            if old_children is not None:
+                del old_children[:]
+                child_pool.append(old_children)
 
-                if self.scope and main._uses_scope:
+            transform = transform # type: ignore
 
-                    local_scope = { }
+            if (transform is not None) and (d is not NO_DISPLAYABLE):
+                if reused and (transform == cache.raw_transform):
 
-                    for i in self.local_constant:
-                        if i in ctx.scope:
-                            local_scope[i] = ctx.scope[i]
+                    if isinstance(cache.inner_transform, renpy.display.transform.Transform):
+                        if cache.inner_transform.child is not d:
+                            cache.inner_transform.set_child(d, duplicate=False)
+
+                    d = cache.outer_transform
+
+                else:
+                    old_outer_transform = cache.outer_transform
+
+                    cache.raw_transform = transform
+                    cache.inner_transform = None
+                    cache.outer_transform = None
+
+                    if isinstance(transform, Transform):
+                        d = transform(child=d)
+                        d._unique()
+
+                        cache.inner_transform = d
+                        cache.outer_transform = d
+
+                    elif isinstance(transform, list_or_tuple):
+                        for t in transform:
+                            if isinstance(t, Transform):
+                                d = t(child=d)
+
+                                cache.outer_transform = d
+                                if cache.inner_transform is None:
+                                    cache.inner_transform = d
+
+                            else:
+                                d = t(d)
+                                cache.raw_transform = None
+                                cache.outer_transform = None
+                                cache.inner_transform = None
+
+                            d._unique()
 
-                    if ctx.scope is context.root_scope:
-                        ctx.uses_scope.append((main, local_scope, None))
                     else:
-                        ctx.uses_scope.append((main, local_scope, ctx.scope))
+                        d = transform(d)
+                        d._unique()
+                        cache.raw_transform = None
+                        cache.outer_transform = None
+                        cache.inner_transform = None
 
-                cache.constant_uses_scope = ctx.uses_scope
+                    if isinstance(d, Transform):
 
-                if context.uses_scope is not None:
-                    context.uses_scope.extend(ctx.uses_scope)
+                        if not context.updating:
+                            old_outer_transform = None
+
+                        d.take_state(old_outer_transform)
+                        d.take_execution_state(old_outer_transform)
+
+            else:
+                cache.inner_transform = None
+                cache.outer_transform = None
+                cache.raw_transform = None
+
+            if ctx.fail:
+                context.fail = True
+
+            else:
+                if self.constant:
+                    cache.constant = d
+
+                    if self.scope and main._uses_scope:
+
+                        local_scope = { }
+
+                        for i in self.local_constant:
+                            if i in ctx.scope:
+                                local_scope[i] = ctx.scope[i]
+
+                        if ctx.scope is context.root_scope:
+                            ctx.uses_scope.append((main, local_scope, None))
+                        else:
+                            ctx.uses_scope.append((main, local_scope, ctx.scope))
+
+                    cache.constant_uses_scope = ctx.uses_scope
+
+                    if context.uses_scope is not None:
+                        context.uses_scope.extend(ctx.uses_scope)
+
+                    # This tests `transform is None`, not cache.raw_transform, as
+                    # the latter is nulled when a plain callable wraps d - and the
+                    # wrapped displayable can carry per-instance state.
+                    if (self.constant == GLOBAL_CONST) and (not ctx.uses_scope) and (transform is None) and (not self.hotspot) and (d is not NO_DISPLAYABLE):
+
+                        # Share this displayable with other instances of the
+                        # screen, unless something in it holds per-instance state.
+                        # Focus and hover state live on any focusable displayable,
+                        # while a viewport's adjustments hold its scroll position
+                        # even when it isn't focusable, a timer counts down, a
+                        # mouse area tracks the pointer, and a transform carries
+                        # its animation state.
+                        stateful = (
+                            renpy.display.viewport.Viewport,
+                            renpy.display.behavior.Timer,
+                            renpy.display.behavior.MouseArea,
+                            renpy.display.transform.Transform,
+                            )
+
+                        shareable = True
+                        worklist = [ d ]
 
-        if d is not NO_DISPLAYABLE:
+                        while worklist:
+                            i = worklist.pop()
 
-            if context.showif is not None:
-                d = self.wrap_in_showif(d, context, cache)
+                            if i.focusable or isinstance(i, stateful):
+                                shareable = False
+                                break
 
-            context.children.append(d)
+                            worklist.extend(j for j in i.visit() if j is not None)
+
+                        if shareable:
+                            self.constant_cache[context.style_prefix] = d
+
+            if d is not NO_DISPLAYABLE:
+
+                if context.showif is not None:
+                    d = self.wrap_in_showif(d, context, cache)
+
+                context.children.append(d)
+
+        finally:
+
+            # Empty out the stashed leaf context, even when an exception
+            # escapes, so it doesn't keep the screen's scope and children
+            # alive between executes. (The next execute's update call
+            # repopulates it in full.)
+            if ctx is self.leaf_context:
+                ctx.__dict__.clear()
 
     def wrap_in_showif(self, d, context, cache):
         """
@@ -1257,7 +1610,7 @@ class SLDisplayable(SLBlock):
 
             profile_log.write("    args: %s", " ".join(report))
 
-        values = self.keyword_values or { }
+        values = self.constant_keywords
 
         if keywords:
             report = { }
@@ -1359,35 +1712,55 @@ class SLIf(SLNode):
 
     def prepare(self, analysis):
 
-        # A list of prepared entries, with each consisting of expression
-        # bytecode and a SLBlock.
-        self.prepared_entries = [ ]
+        # A tuple of prepared entries, with each consisting of expression
+        # bytecode (or None, for the else block) and a SLBlock.
+        prepared_entries = [ ]
 
         for cond, block in self.entries:
             if cond is not None:
                 node = ccache.ast_eval(cond)
 
-                self.constant = min(self.constant, analysis.is_constant(node))
+                const = analysis.is_constant(node)
 
-                cond = compile_expr(self.location, node)
+                if const == GLOBAL_CONST:
+
+                    # The condition can be evaluated now - a false branch is
+                    # dropped entirely, while a true branch becomes the else
+                    # branch and ends the statement.
+                    if eval_const_expr(self.location, node):
+                        cond = None
+                    else:
+                        continue
+
+                else:
+                    self.constant = min(self.constant, const)
+                    cond = compile_expr(self.location, node)
 
             block.prepare(analysis)
             self.constant = min(self.constant, block.constant)
-            self.prepared_entries.append((cond, block))
+            prepared_entries.append((cond, block))
 
             self.has_keyword |= block.has_keyword
             self.last_keyword |= block.last_keyword
 
+            if cond is None:
+                break
+
+        self.prepared_entries = tuple(prepared_entries)
+
     def execute(self, context):
 
         if context.predicting:
             self.execute_predicting(context)
             return
 
+        globals = context.globals # @ReservedAssignment
+        scope = context.scope
+
         for cond, block in self.prepared_entries:
-            if cond is None or eval(cond, context.globals, context.scope):
-                for i in block.children:
-                    i.execute(context)
+            if (cond is None) or eval(cond, globals, scope):
+                for f in block.child_executes:
+                    f(context)
                 return
 
     def execute_predicting(self, context):
@@ -1410,7 +1783,7 @@ class SLIf(SLNode):
             if first and cond_value:
                 first = False
 
-                for i in block.children:
+                for i in block.flat_children:
                     try:
                         i.execute(context)
                     except Exception:
@@ -1432,7 +1805,7 @@ class SLIf(SLNode):
             ctx.children = [ ]
             ctx.unlikely = True
 
-            for i in block.children:
+            for i in block.flat_children:
                 try:
                     i.execute(ctx)
                 except Exception:
@@ -1443,8 +1816,11 @@ class SLIf(SLNode):
 
     def keywords(self, context):
 
+        globals = context.globals # @ReservedAssignment
+        scope = context.scope
+
         for cond, block in self.prepared_entries:
-            if cond is None or eval(cond, context.globals, context.scope):
+            if (cond is None) or eval(cond, globals, scope):
                 block.keywords(context)
                 return
 
@@ -1552,8 +1928,8 @@ class SLShowIf(SLNode):
                 else:
                     ctx.showif = False
 
-            for i in block.children:
-                i.execute(ctx)
+            for f in block.child_executes:
+                f(ctx)
 
             if ctx.fail:
                 context.fail = True
@@ -1635,7 +2011,7 @@ class SLFor(SLBlock):
         const = analysis.is_constant(node)
 
         if const == GLOBAL_CONST:
-            self.expression_value = py_eval_bytecode(compile_expr(self.location, node))
+            self.expression_value = eval_const_expr(self.location, node)
             self.expression_expr = None
         else:
             self.expression_value = None
@@ -1677,26 +2053,40 @@ class SLFor(SLBlock):
 
         ctx = SLContext(context)
 
-        for index, v in enumerate(value): # type: ignore
+        child_executes = self.child_executes
 
-            ctx.scope[variable] = v
+        # If we have a variable expression as a tuple, the first child
+        # unpacks it, and must run before the index value is evaluated,
+        # because the index can be one of the tuple members. Split it off
+        # here, rather than re-deriving this on every iteration.
+        if variable == "_sl2_i":
+            unpacker_execute = child_executes[0]
+            child_executes = child_executes[1:]
+        else:
+            unpacker_execute = None
+
+        index_expression = self.index_expression
+        predicting = context.predicting
+        unlikely = context.unlikely
 
-            children_i = iter(self.children)
+        scope = ctx.scope
+        scope_setitem = scope.__setitem__
+        globals = ctx.globals # @ReservedAssignment
+
+        for index, v in enumerate(value): # type: ignore
 
-            # If we have a variable expression as a tuple, it is necessary
-            # to execute the first child before evaluating the index value,
-            # because the index can be one of this tuple member.
-            if variable == "_sl2_i":
-                sl_python = next(children_i)
+            scope_setitem(variable, v)
+
+            if unpacker_execute is not None:
                 # It can only fail if the unpacking fails, but it can still
                 try:
-                    sl_python.execute(ctx)
+                    unpacker_execute(ctx)
                 except Exception:
-                    if not context.predicting:
+                    if not predicting:
                         raise
 
-            if self.index_expression is not None:
-                index = eval(self.index_expression, ctx.globals, ctx.scope)
+            if index_expression is not None:
+                index = eval(index_expression, globals, scope)
 
             ctx.old_cache = oldcaches.get(index, None) or { }
 
@@ -1712,14 +2102,14 @@ class SLFor(SLBlock):
 
             # Inline of SLBlock.execute.
 
-            for i in children_i:
+            for f in child_executes:
                 try:
-                    i.execute(ctx)
+                    f(ctx)
                 except Exception:
-                    if not context.predicting:
+                    if not predicting:
                         raise
 
-            if context.unlikely:
+            if unlikely:
                 break
 
         context.new_cache[self.serial] = newcaches
@@ -1813,7 +2203,26 @@ class SLDefault(SLNode):
         analysis.mark_not_constant(self.variable)
 
     def prepare(self, analysis):
-        self.expr = compile_expr(self.location, ccache.ast_eval(self.expression))
+
+        node = ccache.ast_eval(self.expression)
+
+        self.expr = None
+        self.expression_value = None
+
+        # If the expression is constant and yields an immutable value,
+        # evaluate it once here. (A mutable value can't be shared, as each
+        # instance of the screen needs its own copy.)
+        if analysis.is_constant(node) == GLOBAL_CONST:
+            value = eval_const_expr(self.location, node)
+
+            if is_immutable(value):
+                self.expression_value = value
+            else:
+                self.expr = compile_expr(self.location, node)
+
+        else:
+            self.expr = compile_expr(self.location, node)
+
         self.constant = NOT_CONST
         self.last_keyword = True
 
@@ -1824,7 +2233,10 @@ class SLDefault(SLNode):
         if variable in scope:
             return
 
-        scope[variable] = eval(self.expr, context.globals, scope)
+        if self.expr is None:
+            scope[variable] = self.expression_value
+        else:
+            scope[variable] = eval(self.expr, context.globals, scope)
 
     def has_python(self):
         return True
@@ -2252,7 +2664,14 @@ class SLCustomUse(SLNode):
                 if ctx.style_prefix is None:
                     kwargs["style"] = style_suffix
                 else:
-                    kwargs["style"] = ctx.style_prefix + "_" + style_suffix
+                    key = (ctx.style_prefix, style_suffix)
+
+                    style = style_name_cache.get(key, None)
+
+                    if style is None:
+                        style = style_name_cache[key] = ctx.style_prefix + "_" + style_suffix
+
+                    kwargs["style"] = style
 
         except Exception:
             if not context.predicting: